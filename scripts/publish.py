@@ -1,17 +1,40 @@
 """Orchestrate building, uploading, and deleting signing test packages."""
 
+import functools
+import gzip
+import hashlib
+import http.client
+import itertools
 import json
 import os
+import queue
+import re
+import shutil
 import subprocess
 import sys
-import urllib.request
+import threading
+import time
 import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 BASE_URL = "https://beta.prefix.dev"
 CHANNEL = "signing-tests"
 ROOT = Path(__file__).resolve().parent.parent
 OUTPUT_DIR = ROOT / "output"
+BUILD_CACHE_DIR = ROOT / ".cache" / "build"
+# KEY=value assignments in .env; comment and blank lines never match
+_ENV_RE = re.compile(r"^[^\S\n]*([A-Za-z_][A-Za-z0-9_]*)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*$", re.MULTILINE)
+# Upper bound on concurrent requests against the prefix.dev API
+MAX_CONCURRENT_REQUESTS = 8
+# Redirects followed by GET requests to the prefix.dev API
+MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+# Repodata polls before an uploaded package counts as missing, and the first
+# delay between polls in seconds (doubled after every poll)
+VERIFY_ATTEMPTS = 5
+VERIFY_DELAY = 2
 
 # Central registry of test packages: name -> subdir
 PACKAGES = {
@@ -20,25 +43,176 @@ PACKAGES = {
     "variants-unsigned": "linux-64",
 }
 
+# Per-package pattern for variant builds that are uploaded with attestation:
+# name -> regex matched against the package filename
+SIGNED_VARIANTS = {
+    "variants-unsigned": re.compile(r"py312"),
+}
+
+
+_print_lock = threading.Lock()
+
+
+def log(message):
+    """Print a line without interleaving output from other threads."""
+    with _print_lock:
+        print(message, flush=True)
+
+
+def spawn(cmd):
+    """Start a command with its stdout and stderr captured into one pipe."""
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def wait(proc):
+    """Wait for a process started by ``spawn`` and print its output in one block.
+
+    Raises ``subprocess.CalledProcessError`` if the process failed.
+    """
+    output, _ = proc.communicate()
+    if output:
+        log(output.rstrip("\n"))
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output)
+
 
 # ---------------------------------------------------------------------------
 # Build / upload helpers
 # ---------------------------------------------------------------------------
 
-def build_recipe(recipe_path, output_dir, variant_config=None, target_platform=None):
-    """Build a recipe with rattler-build."""
+def build_command(recipe_path, output_dir, variant_config=None, target_platform=None):
+    """Return the rattler-build command line for building a recipe."""
     channel_url = f"{BASE_URL}/{CHANNEL}"
-    cmd = ["rattler-build", "build", "-r", str(recipe_path), "--output-dir", str(output_dir), "--skip-existing", "all", "-c", channel_url, "-c", "conda-forge"]
+    cmd = ["rattler-build", "build", "-r", os.fspath(recipe_path), "--output-dir", os.fspath(output_dir), "--skip-existing", "all", "-c", channel_url, "-c", "conda-forge"]
     if variant_config:
-        cmd += ["-m", str(variant_config)]
+        cmd += ["-m", os.fspath(variant_config)]
     if target_platform:
         cmd += ["--target-platform", target_platform]
-    print(f"Building: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    return cmd
+
+
+@functools.cache
+def rattler_build_version():
+    """Return the ``rattler-build --version`` string of the installed tool."""
+    result = subprocess.run(["rattler-build", "--version"], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
 
+def build_cache_key(cmd, recipe_path, variant_config=None):
+    """Hash the recipe files and build options that determine a build's output.
 
-def upload_package(pkg_path, generate_attestation=False):
-    """Upload a package to prefix.dev."""
+    The rattler-build version is part of the key, so upgrading the tool through
+    pixi invalidates the cache. Dependencies resolved from conda-forge at build
+    time are not; clear ``BUILD_CACHE_DIR`` to pick up newer ones.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(rattler_build_version().encode() + b"\0")
+    args = cmd[1:]
+    i = args.index("--output-dir")
+    for arg in args[:i] + args[i + 2:]:
+        if os.path.isabs(arg):
+            arg = os.path.relpath(arg, ROOT)
+        digest.update(arg.encode() + b"\0")
+    files = {p for p in Path(recipe_path).parent.rglob("*") if p.is_file()}
+    if variant_config:
+        files.add(Path(variant_config))
+    for path in sorted(files):
+        digest.update(str(path.relative_to(ROOT)).encode() + b"\0")
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_recipe(recipe_path, output_dir, variant_config=None, target_platform=None):
+    """Build a recipe with rattler-build, reusing cached packages when possible.
+
+    Packages written by a build are copied to ``BUILD_CACHE_DIR`` under a key
+    derived from the recipe contents and build options. If the same recipe is
+    built again, rattler-build is not run at all. Like ``--skip-existing all``,
+    cached packages that are already on the channel are not restored; the rest
+    are copied into ``output_dir``. If the channel cannot be checked, the recipe
+    is built as usual.
+    """
+    cmd = build_command(recipe_path, output_dir, variant_config, target_platform)
+    cache_dir = BUILD_CACHE_DIR / build_cache_key(cmd, recipe_path, variant_config)
+    manifest = cache_dir / "manifest.json"
+    if manifest.exists():
+        packages = json.loads(manifest.read_text())
+        try:
+            published = published_packages(packages)
+        except (urllib.error.HTTPError, OSError) as e:
+            log(f"Could not check {CHANNEL} for cached build of {recipe_path} ({e}); rebuilding")
+        else:
+            log(f"Using cached build of {recipe_path} from {cache_dir}")
+            for rel in packages:
+                if rel in published:
+                    log(f"Skipping {rel}: already on {CHANNEL}")
+                    continue
+                (output_dir / rel).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(cache_dir / rel, output_dir / rel)
+            return
+
+    # Snapshot existing packages so leftovers from earlier builds aren't cached
+    before = {p: p.stat().st_mtime_ns for p in scan_conda(output_dir)}
+    log(f"Building: {' '.join(cmd)}")
+    wait(spawn(cmd))
+
+    # With --skip-existing nothing may have been built; leave the cache empty
+    packages = [
+        p.relative_to(output_dir).as_posix()
+        for p in scan_conda(output_dir)
+        if before.get(p) != p.stat().st_mtime_ns
+    ]
+    if not packages:
+        return
+    for rel in packages:
+        (cache_dir / rel).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(output_dir / rel, cache_dir / rel)
+    manifest.write_text(json.dumps(packages))
+
+
+def published_packages(rel_paths):
+    """Return the ``<subdir>/<filename>`` paths that are already on the channel."""
+    published = set()
+    for subdir in {rel.split("/")[0] for rel in rel_paths}:
+        published.update(f"{subdir}/{fn}" for fn in fetch_repodata(get_public_session(), subdir))
+    return published.intersection(rel_paths)
+
+
+def build_recipes(recipes_dir, output_dir):
+    """Build every versioned recipe under ``recipes_dir`` concurrently.
+
+    Each version gets its own output directory so parallel rattler-build runs
+    never index the same local channel at the same time. Yields each version's
+    output directory in sorted version-directory order, as soon as that build
+    and every earlier one have finished, so callers see a deterministic order
+    while later builds keep running. When a build fails, builds that have not
+    started yet are cancelled and the error is re-raised once the builds
+    already running have finished.
+    """
+    # DirEntry.is_dir() reuses the file type from readdir instead of a stat per entry
+    with os.scandir(recipes_dir) as entries:
+        version_dirs = sorted(Path(e.path) for e in entries if e.is_dir())
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [
+            (executor.submit(build_recipe, d / "recipe.yaml", output_dir / d.name), output_dir / d.name)
+            for d in version_dirs
+        ]
+        try:
+            for future, build_dir in futures:
+                future.result()
+                yield build_dir
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def scan_conda(output_dir):
+    """Return the ``.conda`` packages below ``output_dir`` in no particular order."""
+    return list(output_dir.rglob("*.conda"))
+
+
+def upload_packages(pkg_paths, generate_attestation=False):
+    """Upload packages to prefix.dev with a single rattler-build invocation."""
     cmd = [
         "rattler-build", "upload", "prefix",
         "-c", CHANNEL,
@@ -46,28 +220,81 @@ def upload_package(pkg_path, generate_attestation=False):
     ]
     if generate_attestation:
         cmd.append("--generate-attestation")
-    cmd.append(str(pkg_path))
-    print(f"Uploading: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+    cmd += map(os.fspath, pkg_paths)
+    log(f"Uploading: {' '.join(cmd)}")
+    wait(spawn(cmd))
+
+
+class Uploader:
+    """Upload packages on a background thread while builds keep running.
+
+    Packages are uploaded in submission order. Packages that queue up back to
+    back with the same attestation setting while an upload is in progress are
+    sent together in one rattler-build call. Successfully uploaded packages are
+    collected in ``uploaded``. After a failed upload the remaining packages are
+    skipped and the error is re-raised when the context exits. If the body of
+    the ``with`` block raises (e.g. a build fails), packages that are still
+    queued are not uploaded.
+    """
+
+    def __init__(self):
+        self.uploaded = []
+        self._queue = queue.Queue()
+        self._error = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cancelled = exc_type is not None
+        self._queue.put(None)
+        self._thread.join()
+        if exc_type is None and self._error is not None:
+            raise self._error
+
+    def submit(self, pkg_path, generate_attestation=False):
+        """Queue a package for upload."""
+        self._queue.put((pkg_path, generate_attestation))
+
+    def _run(self):
+        done = False
+        while not done:
+            items = [self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get())
+            if items[-1] is None:
+                items.pop()
+                done = True
+            for generate_attestation, group in itertools.groupby(items, key=lambda item: item[1]):
+                if self._cancelled or self._error is not None:
+                    break
+                batch = [pkg for pkg, _ in group]
+                try:
+                    upload_packages(batch, generate_attestation)
+                except Exception as e:
+                    self._error = e
+                else:
+                    self.uploaded += batch
 
 
 # ---------------------------------------------------------------------------
-# Delete helpers
+# Channel helpers
 # ---------------------------------------------------------------------------
 
+@functools.cache
 def load_env():
     """Load variables from .env file at the project root if it exists."""
     env_file = ROOT / ".env"
     if not env_file.exists():
         return
-    for line in env_file.read_text().splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        key, _, value = line.partition("=")
-        os.environ.setdefault(key.strip(), value.strip())
+    for key, value in _ENV_RE.findall(env_file.read_text()):
+        os.environ.setdefault(key, value)
 
 
+@functools.cache
 def get_api_key():
     """Get the API key from .env or the PREFIX_API_KEY environment variable."""
     load_env()
@@ -78,65 +305,206 @@ def get_api_key():
     return api_key
 
 
-def list_packages(subdir, package_name):
-    """List all packages matching a name from the channel's repodata."""
+class Session:
+    """Pool of keep-alive HTTPS connections to prefix.dev.
+
+    Safe to share between threads: each request borrows an idle connection,
+    opening a new one only when all of them are busy, and hands it back once
+    the response has been read. Responses are requested gzip-compressed and
+    decompressed transparently.
+    """
+
+    def __init__(self, headers=None):
+        self._host = urllib.parse.urlsplit(BASE_URL).netloc
+        self._headers = {"User-Agent": "signing-tests", "Accept-Encoding": "gzip", **(headers or {})}
+        self._idle = queue.LifoQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+    def request(self, method, url):
+        """Send a request and return ``(status, reason, body)``.
+
+        GET requests follow up to ``MAX_REDIRECTS`` redirects, like ``urlopen``
+        does. For other methods the 3xx status is returned to the caller.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, location, body = self._send(method, url)
+            if method != "GET" or status not in _REDIRECT_STATUSES or not location:
+                break
+            url = urllib.parse.urljoin(url, location)
+        return status, reason, body
+
+    def _send(self, method, url):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        pooled = parts.netloc == self._host
+        headers = self._headers
+        if not pooled:
+            # Redirected to another host: don't hand it our credentials
+            headers = {k: v for k, v in headers.items() if k != "Authorization"}
+        for attempt in range(2):
+            conn = self._borrow() if pooled and not attempt else self._connect(parts)
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except ConnectionError:
+                # The server closed the idle keep-alive connection; reconnect once
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            break
+        if pooled:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        if resp.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return resp.status, resp.reason, resp.getheader("Location"), body
+
+    def _borrow(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPSConnection(self._host, timeout=30)
+
+    @staticmethod
+    def _connect(parts):
+        if parts.scheme == "http":
+            return http.client.HTTPConnection(parts.netloc, timeout=30)
+        return http.client.HTTPSConnection(parts.netloc, timeout=30)
+
+
+def fetch_repodata(session, subdir):
+    """Fetch the ``packages.conda`` entries from a subdir's repodata."""
     repodata_url = f"{BASE_URL}/{CHANNEL}/{subdir}/repodata.json"
-    print(f"Fetching repodata from {repodata_url}")
-    req = urllib.request.Request(repodata_url, headers={"User-Agent": "signing-tests"})
-    with urllib.request.urlopen(req) as resp:
-        repodata = json.loads(resp.read())
+    log(f"Fetching repodata from {repodata_url}")
+    status, reason, body = session.request("GET", repodata_url)
+    if status != 200:
+        raise urllib.error.HTTPError(repodata_url, status, reason, None, None)
+    return json.loads(body).get("packages.conda", {})
+
+
+def filter_packages(packages, package_name):
+    """Return the sorted filenames of ``packages`` entries named ``package_name``."""
+    return sorted(fn for fn, info in packages.items() if info["name"] == package_name)
 
-    matching = []
-    for filename, info in repodata.get("packages.conda", {}).items():
-        if info["name"] == package_name:
-            matching.append(filename)
-    return sorted(matching)
 
+def list_packages(session, subdir, package_name):
+    """List all packages matching a name from the channel's repodata."""
+    return filter_packages(fetch_repodata(session, subdir), package_name)
+
+
+@functools.cache
+def get_session():
+    """Return the authenticated session shared by every delete request."""
+    return Session({"Authorization": f"Bearer {get_api_key()}"})
 
-def delete_package(subdir, package_filename, api_key):
+
+@functools.cache
+def get_public_session():
+    """Return the anonymous session used to read repodata after publishing.
+
+    Publishing authenticates through rattler-build, so no API key is needed.
+    Caches are asked to revalidate so freshly uploaded packages show up.
+    """
+    return Session({"Cache-Control": "no-cache"})
+
+
+def delete_package(session, subdir, package_filename):
     """Delete a single package from the channel via the REST API."""
     url = f"{BASE_URL}/api/v1/delete/{CHANNEL}/{subdir}/{package_filename}"
-    print(f"Deleting: {url}")
-    req = urllib.request.Request(url, method="DELETE")
-    req.add_header("Authorization", f"Bearer {api_key}")
-    try:
-        with urllib.request.urlopen(req) as resp:
-            print(f"  -> {resp.status} {resp.reason}")
-    except urllib.error.HTTPError as e:
-        print(f"  -> {e.code} {e.reason}")
-        if e.code != 404:
-            raise
+    status, reason, _ = session.request("DELETE", url)
+    log(f"Deleting: {url} -> {status} {reason}")
+    if not 200 <= status < 300 and status != 404:
+        raise urllib.error.HTTPError(url, status, reason, None, None)
+
+
+def delete_package_files(session, name, subdir, filenames):
+    """Delete the given package files of a test package concurrently."""
+    if not filenames:
+        log(f"No packages found for {name!r} in {subdir}")
+        return
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(lambda f: delete_package(session, subdir, f), filenames))
 
 
 def delete_packages(name):
     """Delete all packages for a given test package name."""
     subdir = PACKAGES[name]
-    api_key = get_api_key()
-    filenames = list_packages(subdir, name)
-    if not filenames:
-        print(f"No packages found for {name!r} in {subdir}")
-        return
-    for filename in filenames:
-        delete_package(subdir, filename, api_key)
+    session = get_session()
+    delete_package_files(session, name, subdir, list_packages(session, subdir, name))
+
+
+def delete_all_packages():
+    """Delete the packages of every test package.
+
+    The repodata of each subdir is fetched once, with all subdirs fetched
+    concurrently, before any deletes are issued.
+    """
+    session = get_session()
+    subdirs = sorted(set(PACKAGES.values()))
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        repodata = dict(zip(subdirs, executor.map(lambda s: fetch_repodata(session, s), subdirs)))
+    for name, subdir in PACKAGES.items():
+        delete_package_files(session, name, subdir, filter_packages(repodata[subdir], name))
 
 
 # ---------------------------------------------------------------------------
 # Publish handlers
 # ---------------------------------------------------------------------------
 
+def verify_uploaded(name, pkg_paths):
+    """Check that every uploaded package is listed in the channel's repodata.
+
+    The channel may take a moment to index new uploads, and repodata requests
+    can fail transiently, so repodata is polled up to ``VERIFY_ATTEMPTS`` times
+    with exponential backoff before failing.
+    """
+    if not pkg_paths:
+        return
+    subdir = PACKAGES[name]
+    expected = {p.name for p in pkg_paths}
+    for attempt in range(VERIFY_ATTEMPTS):
+        try:
+            missing = sorted(expected - set(list_packages(get_public_session(), subdir, name)))
+        except (urllib.error.HTTPError, OSError) as e:
+            problem = f"could not fetch repodata ({e})"
+        else:
+            if not missing:
+                log(f"Verified {len(pkg_paths)} {name} package(s) in {CHANNEL}/{subdir}")
+                return
+            problem = f"not yet listed: {', '.join(missing)}"
+        if attempt + 1 < VERIFY_ATTEMPTS:
+            delay = VERIFY_DELAY * 2 ** attempt
+            log(f"{CHANNEL}/{subdir}: {problem}; retrying in {delay}s")
+            time.sleep(delay)
+    raise RuntimeError(f"Could not verify {name} uploads in {CHANNEL}/{subdir}: {problem}")
+
+
 def publish_all_signed():
     """Build v1 + v2, upload both with attestation."""
     name = "all-signed"
     output_dir = OUTPUT_DIR / name
     recipes = ROOT / "recipes" / name
 
-    for version_dir in sorted(recipes.iterdir()):
-        if not version_dir.is_dir():
-            continue
-        build_recipe(version_dir / "recipe.yaml", output_dir)
-
-    for pkg in sorted(output_dir.rglob("*.conda")):
-        upload_package(pkg, generate_attestation=True)
+    with Uploader() as uploader:
+        for build_dir in build_recipes(recipes, output_dir):
+            for pkg in scan_conda(build_dir):
+                uploader.submit(pkg, generate_attestation=True)
+    return uploader.uploaded
 
 
 def publish_last_version_unsigned():
@@ -149,21 +517,19 @@ def publish_last_version_unsigned():
     output_dir = OUTPUT_DIR / name
     recipes = ROOT / "recipes" / name
 
-    for version_dir in sorted(recipes.iterdir()):
-        if not version_dir.is_dir():
-            continue
-        build_recipe(version_dir / "recipe.yaml", output_dir)
-
-    packages = sorted(output_dir.rglob("*.conda"))
-
-    # Upload signed versions first (v1.0.0, v2.0.0), then unsigned (v1.5.0) last
-    signed_pkgs = [p for p in packages if "1.5.0" not in p.name]
-    unsigned_pkgs = [p for p in packages if "1.5.0" in p.name]
-
-    for pkg in signed_pkgs:
-        upload_package(pkg, generate_attestation=True)
-    for pkg in unsigned_pkgs:
-        upload_package(pkg, generate_attestation=False)
+    # Upload signed versions as they are built, in version order (v1.0.0,
+    # v2.0.0), then unsigned (v1.5.0) last once every build has finished
+    unsigned_pkgs = []
+    with Uploader() as uploader:
+        for build_dir in build_recipes(recipes, output_dir):
+            for pkg in scan_conda(build_dir):
+                if "1.5.0" in pkg.name:
+                    unsigned_pkgs.append(pkg)
+                else:
+                    uploader.submit(pkg, generate_attestation=True)
+        for pkg in unsigned_pkgs:
+            uploader.submit(pkg, generate_attestation=False)
+    return uploader.uploaded
 
 
 def publish_variants_unsigned():
@@ -175,33 +541,65 @@ def publish_variants_unsigned():
 
     build_recipe(recipe, output_dir, variant_config=variants, target_platform="linux-64")
 
-    for pkg in sorted(output_dir.rglob("*.conda")):
-        signed = "py312" in pkg.name
-        upload_package(pkg, generate_attestation=signed)
+    with Uploader() as uploader:
+        for pkg in scan_conda(output_dir):
+            signed = SIGNED_VARIANTS[name].search(pkg.name) is not None
+            uploader.submit(pkg, generate_attestation=signed)
+    return uploader.uploaded
+
+
+def publish(name):
+    """Run a package's publish handler, then check its uploads reached the channel."""
+    verify_uploaded(name, _PUBLISH_HANDLERS[name]())
 
 
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
 
-def main():
-    actions = {
-        "publish": {
-            "all-signed": publish_all_signed,
-            "last-version-unsigned": publish_last_version_unsigned,
-            "variants-unsigned": publish_variants_unsigned,
-        },
-        "delete": {name: (lambda n=name: delete_packages(n)) for name in PACKAGES},
-    }
+_PUBLISH_HANDLERS = {
+    "all-signed": publish_all_signed,
+    "last-version-unsigned": publish_last_version_unsigned,
+    "variants-unsigned": publish_variants_unsigned,
+}
+_DELETE_HANDLERS = {name: functools.partial(delete_packages, name) for name in PACKAGES}
+_ACTIONS = {
+    "publish": {name: functools.partial(publish, name) for name in _PUBLISH_HANDLERS},
+    "delete": _DELETE_HANDLERS,
+}
+
+
+def publish_all():
+    """Run every publish handler in turn.
 
+    Each package's upload check runs on a background thread while the next
+    package is built and uploaded.
+    """
+    with ThreadPoolExecutor(max_workers=len(_PUBLISH_HANDLERS)) as executor:
+        checks = [
+            executor.submit(verify_uploaded, name, handler())
+            for name, handler in _PUBLISH_HANDLERS.items()
+        ]
+    for check in checks:
+        check.result()
+
+
+# Handlers for the "all" target, keyed by action
+_ALL_HANDLERS = {
+    "publish": publish_all,
+    "delete": delete_all_packages,
+}
+
+
+def main():
     if len(sys.argv) < 2:
         print(f"Usage: {sys.argv[0]} <publish|delete> <{'|'.join(PACKAGES)}|all>")
         sys.exit(1)
 
     action = sys.argv[1]
-    if action not in actions:
+    if action not in _ACTIONS:
         print(f"Unknown action: {action}")
-        print(f"Choose from: {', '.join(actions)}")
+        print(f"Choose from: {', '.join(_ACTIONS)}")
         sys.exit(1)
 
     if len(sys.argv) < 3:
@@ -209,11 +607,10 @@ def main():
         sys.exit(1)
 
     target = sys.argv[2]
-    handlers = actions[action]
+    handlers = _ACTIONS[action]
 
     if target == "all":
-        for handler in handlers.values():
-            handler()
+        _ALL_HANDLERS[action]()
     elif target in handlers:
         handlers[target]()
     else: